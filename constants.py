@@ -9,6 +9,7 @@ ONOFF_ATTRIBUTE_ID = 0
 # Default configuration paths
 DEFAULT_CONFIG_FILE = "matter2mqtt.yaml"
 DEFAULT_CONFIG_EXAMPLE_FILE = "matter2mqtt.yaml.example"
+DEFAULT_CONFIG_CACHE_FILE = ".matter2mqtt.yaml.json"
 
 # MQTT Topics and Payloads
 MQTT_CMD_TOPIC_PATTERN = "matter/+/+/set"
@@ -17,17 +18,32 @@ MQTT_PAYLOAD_OFF = "OFF"
 MQTT_PAYLOAD_AVAILABLE = "true"
 MQTT_PAYLOAD_UNAVAILABLE = "false"
 
+# Pre-encoded payloads, paho publishes bytes without re-encoding
+MQTT_PAYLOAD_ON_B = b"ON"
+MQTT_PAYLOAD_OFF_B = b"OFF"
+MQTT_PAYLOAD_AVAILABLE_B = b"true"
+MQTT_PAYLOAD_UNAVAILABLE_B = b"false"
+
 # Home Assistant Discovery
 HA_DISCOVERY_DEVICE_CLASS = "light"
 
+# permessage-deflate window bits for the Matter WebSocket (9-15, 0 disables)
+DEFAULT_MATTER_WS_COMPRESS = 15
+
 # Timeouts (seconds)
 MATTER_WS_CONNECT_TIMEOUT = 5.0
 MATTER_SEND_COMMAND_TIMEOUT = 15.0
 DEVICE_COMMAND_TIMEOUT = 15.0
+MQTT_PUBLISH_TIMEOUT = 5.0
+
+# Full snapshot refresh interval (seconds). Live changes arrive as Matter
+# events, this is only a safety net for missed updates.
+SNAPSHOT_REFRESH_INTERVAL = 300
 
-# Refresh interval (seconds)
-SNAPSHOT_REFRESH_INTERVAL = 30
+# Maximum number of MQTT commands waiting to be sent to Matter
+CMD_QUEUE_MAXSIZE = 256
 
 # MQTT settings
 MQTT_QOS = 1
 MQTT_KEEPALIVE = 60
+MQTT_RECONNECT_MAX_DELAY = 60.0
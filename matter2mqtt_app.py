@@ -4,12 +4,26 @@ import asyncio
 import json
 import logging
 import os
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, FrozenSet, List, Optional, Set, Tuple, Union
 
+import aiohttp
+import paho.mqtt.client as mqtt
 import yaml
 
 from constants import (
+    CMD_QUEUE_MAXSIZE,
+    DEFAULT_CONFIG_CACHE_FILE,
     DEFAULT_CONFIG_FILE,
+    DEFAULT_MATTER_WS_COMPRESS,
+    DEVICE_COMMAND_TIMEOUT,
+    MQTT_PAYLOAD_AVAILABLE_B,
+    MQTT_PAYLOAD_OFF,
+    MQTT_PAYLOAD_OFF_B,
+    MQTT_PAYLOAD_ON,
+    MQTT_PAYLOAD_ON_B,
+    MQTT_PAYLOAD_UNAVAILABLE_B,
+    ONOFF_ATTRIBUTE_ID,
+    ONOFF_CLUSTER_ID,
     SNAPSHOT_REFRESH_INTERVAL,
 )
 from models import EndpointInfo, MqttCommand
@@ -21,6 +35,44 @@ from topics import topic_state, topic_available, ha_discovery_topic
 
 logger = logging.getLogger(__name__)
 
+# Optional: orjson encodes straight to bytes, which paho publishes as-is.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _config_source_stamp() -> Dict[str, int]:
+    """Identify the current YAML file contents by exact mtime and size."""
+    st = os.stat(DEFAULT_CONFIG_FILE)
+    return {"mtime_ns": st.st_mtime_ns, "size": st.st_size}
+
+
+def _load_cached_config() -> Optional[Dict[str, Any]]:
+    """Return the JSON config cache if it was written for the current YAML file."""
+    try:
+        with open(DEFAULT_CONFIG_CACHE_FILE, 'r') as f:
+            cache = json.load(f)
+        if not isinstance(cache, dict) or cache.get("source") != _config_source_stamp():
+            return None
+        return cache.get("config")
+    except (OSError, ValueError) as e:
+        logger.debug(f"Config cache not usable: {e}")
+        return None
+
+
+def _write_cached_config(config: Dict[str, Any], source: Dict[str, int]):
+    """Write parsed config to the JSON cache, ignoring failures."""
+    try:
+        # JSON turns non-string keys into strings; don't cache what would not round-trip
+        if json.loads(json.dumps(config)) != config:
+            logger.debug("Config does not round-trip through JSON, not caching it")
+            return
+        with open(DEFAULT_CONFIG_CACHE_FILE, 'w') as f:
+            json.dump({"source": source, "config": config}, f)
+    except (OSError, TypeError, ValueError) as e:
+        logger.debug(f"Could not write config cache: {e}")
+
 
 def _load_config() -> Dict[str, Any]:
     """Load and validate configuration file."""
@@ -31,11 +83,20 @@ def _load_config() -> Dict[str, Any]:
             f"and update with your settings."
         )
     
-    try:
-        with open(DEFAULT_CONFIG_FILE, 'r') as f:
-            config = yaml.safe_load(f)
-    except yaml.YAMLError as e:
-        raise ValueError(f"Invalid YAML in '{DEFAULT_CONFIG_FILE}': {e}")
+    # Skip YAML parsing on warm starts when the cache is up to date
+    config = _load_cached_config()
+    if config is None:
+        try:
+            # Stamp before reading so an edit during the read invalidates the cache
+            source = _config_source_stamp()
+            # Prefer the libyaml-backed loader when PyYAML was built with it
+            loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+            with open(DEFAULT_CONFIG_FILE, 'r') as f:
+                config = yaml.load(f, Loader=loader)
+        except yaml.YAMLError as e:
+            raise ValueError(f"Invalid YAML in '{DEFAULT_CONFIG_FILE}': {e}")
+        if config:
+            _write_cached_config(config, source)
     
     if not config:
         raise ValueError(f"'{DEFAULT_CONFIG_FILE}' is empty")
@@ -67,6 +128,25 @@ except (FileNotFoundError, ValueError, yaml.YAMLError) as e:
     raise
 
 MATTER_WS_URL = config['matter_ws']['url']
+MATTER_WS_COMPRESS = config['matter_ws'].get('compress', DEFAULT_MATTER_WS_COMPRESS)
+
+
+# MQTT payloads by boolean state
+_STATE_PAYLOADS = {True: MQTT_PAYLOAD_ON_B, False: MQTT_PAYLOAD_OFF_B}
+_AVAIL_PAYLOADS = {True: MQTT_PAYLOAD_AVAILABLE_B, False: MQTT_PAYLOAD_UNAVAILABLE_B}
+
+
+def _coalesce_command(pending: Dict[Tuple[int, int], str], cmd: MqttCommand):
+    """Merge cmd into pending, keeping one effective action per endpoint."""
+    key = (cmd.node_id, cmd.endpoint)
+    prev = pending.get(key)
+    if cmd.action != "toggle" or prev is None:
+        pending[key] = cmd.action
+    elif prev == "toggle":
+        # two toggles cancel out
+        del pending[key]
+    else:
+        pending[key] = "off" if prev == "on" else "on"
 
 
 class Matter2MQTT:
@@ -74,17 +154,38 @@ class Matter2MQTT:
 
     def __init__(self):
         self.loop = asyncio.get_running_loop()
-        self.cmd_queue: asyncio.Queue[MqttCommand] = asyncio.Queue()
+        self.cmd_queue: asyncio.Queue[MqttCommand] = asyncio.Queue(maxsize=CMD_QUEUE_MAXSIZE)
 
         self.mqtt = MqttBridge(self.loop, self.cmd_queue)
-        self.matter_ws = MatterWS(MATTER_WS_URL)
-        self.matter_cmd = MatterCommander(MATTER_WS_URL)
+        self.mqtt.on_reconnect = self._on_mqtt_reconnect
+        # One HTTP session (connection pool) for both Matter clients
+        self.session = aiohttp.ClientSession()
+        self.matter_ws = MatterWS(MATTER_WS_URL, self.session, compress=MATTER_WS_COMPRESS)
+        self.matter_cmd = MatterCommander(MATTER_WS_URL, self.session)
 
         # Track last published states to avoid spamming
         self.last_state: Dict[Tuple[int, int], Optional[bool]] = {}
         self.last_avail: Dict[Tuple[int, int], Optional[bool]] = {}
 
+        # Topics and discovery payloads rendered once per endpoint
+        self._render_cache: Dict[Tuple[int, int], Tuple[str, str, str, bytes]] = {}
+
+        # Endpoints whose discovery message is already retained on the broker.
+        # discovery_dirty (set on MQTT reconnect) forces re-publishing on the next publish.
+        self._discovered: Set[Tuple[int, int]] = set()
+        self.discovery_dirty = False
+
+        # Local shadow of Matter nodes, kept current by pushed events
+        self._nodes: Dict[int, Dict[str, Any]] = {}
+
+        # Endpoint set from the last full refresh, to log discovery only on change
+        self._last_discovered_set: FrozenSet[Tuple[int, int]] = frozenset()
+
+        # Republish scheduled by an MQTT reconnect
+        self._republish_task: Optional[asyncio.Task] = None
+
         self.running = True
+        self._stop_event = asyncio.Event()
 
     async def start(self):
         """Start the bridge."""
@@ -103,7 +204,12 @@ class Matter2MQTT:
         except Exception as e:
             logger.warning(f"Matter commander not available, commands disabled: {e}")
 
-        await self.refresh_snapshot()
+        # Subscribe once; later changes arrive as events on the same socket.
+        # The reader applies the snapshot to the shadow before delivering any event.
+        self.matter_ws.on_nodes = self._apply_snapshot
+        self.matter_ws.on_event = self._on_matter_event
+        await self.matter_ws.start_listening()
+        await self.refresh_snapshot(fetch=False)
 
         self._tasks = [
             asyncio.create_task(self.periodic_refresh_task(), name="refresh"),
@@ -118,9 +224,12 @@ class Matter2MQTT:
         if not self.running:
             return
         self.running = False
+        self._stop_event.set()
 
         # Cancel tasks first
-        tasks = getattr(self, "_tasks", [])
+        tasks = list(getattr(self, "_tasks", []))
+        if self._republish_task is not None:
+            tasks.append(self._republish_task)
         for t in tasks:
             t.cancel()
         for t in tasks:
@@ -144,115 +253,221 @@ class Matter2MQTT:
             await self.matter_cmd.close()
         except Exception:
             pass
+        try:
+            await self.session.close()
+        except Exception:
+            pass
 
-    def publish_ha_discovery(self, ep: EndpointInfo):
-        """Publish Home Assistant discovery message."""
-        payload = {
-            "name": f"Matter {ep.node_id}/{ep.endpoint}",
-            "state_topic": topic_state(ep.node_id, ep.endpoint),
-            "command_topic": f"matter/{ep.node_id}/{ep.endpoint}/set",
-            "availability_topic": topic_available(ep.node_id, ep.endpoint),
-            "payload_on": "ON",
-            "payload_off": "OFF",
-            "unique_id": f"matter_{ep.node_id}_{ep.endpoint}",
-            "device": {
-                "identifiers": [f"matter_node_{ep.node_id}"],
-                "name": f"Matter Node {ep.node_id}",
-                "manufacturer": "Matter",
-                "model": "OnOff Device",
-            },
-        }
-
-        self.mqtt.publish_retained(
-            ha_discovery_topic(ep.node_id, ep.endpoint),
-            json.dumps(payload),
-        )
-        logger.debug(f"Home Assistant discovery published for node {ep.node_id} endpoint {ep.endpoint}")
+    def _render_endpoint(self, ep: EndpointInfo) -> Tuple[str, str, str, bytes]:
+        """Return cached (state_topic, avail_topic, discovery_topic, discovery_payload) for endpoint."""
+        key = (ep.node_id, ep.endpoint)
+        rendered = self._render_cache.get(key)
+        if rendered is None:
+            payload = {
+                "name": f"Matter {ep.node_id}/{ep.endpoint}",
+                "state_topic": topic_state(ep.node_id, ep.endpoint),
+                "command_topic": f"matter/{ep.node_id}/{ep.endpoint}/set",
+                "availability_topic": topic_available(ep.node_id, ep.endpoint),
+                "payload_on": MQTT_PAYLOAD_ON,
+                "payload_off": MQTT_PAYLOAD_OFF,
+                "unique_id": f"matter_{ep.node_id}_{ep.endpoint}",
+                "device": {
+                    "identifiers": [f"matter_node_{ep.node_id}"],
+                    "name": f"Matter Node {ep.node_id}",
+                    "manufacturer": "Matter",
+                    "model": "OnOff Device",
+                },
+            }
+            rendered = (
+                payload["state_topic"],
+                payload["availability_topic"],
+                ha_discovery_topic(ep.node_id, ep.endpoint),
+                orjson.dumps(payload) if orjson is not None else json.dumps(payload).encode("utf-8"),
+            )
+            self._render_cache[key] = rendered
+        return rendered
 
     async def periodic_refresh_task(self):
-        """Periodically refresh snapshot from Matter."""
-        while self.running:
-            await asyncio.sleep(SNAPSHOT_REFRESH_INTERVAL)
-            if not self.running:
-                break
+        """Periodically refresh snapshot from Matter until stopped."""
+        while True:
+            try:
+                await asyncio.wait_for(self._stop_event.wait(), timeout=SNAPSHOT_REFRESH_INTERVAL)
+                return
+            except asyncio.TimeoutError:
+                pass
             try:
                 await self.refresh_snapshot()
             except Exception as e:
-                if not self.running:
-                    break
-                # Ignore shutdown/closing transport noise
-                msg = str(e)
-                if "closing transport" in msg or "Cannot write to closing transport" in msg:
-                    logger.debug("WebSocket closing during shutdown")
-                    break
+                if self._stop_event.is_set():
+                    return
                 logger.error(f"Snapshot refresh error: {e}", exc_info=True)
 
-    async def refresh_snapshot(self):
-        """Refresh snapshot and publish state."""
-        nodes = await self.matter_ws.snapshot_nodes()
-        # Extract onoff endpoints for all nodes
-        endpoints: List[EndpointInfo] = []
-        for n in nodes:
-            endpoints.extend(extract_onoff_endpoints_from_node(n))
-
-        if not endpoints:
-            logger.debug("No OnOff endpoints found")
+    def _on_mqtt_reconnect(self):
+        """Republish discovery, availability and state after an MQTT reconnect."""
+        logger.info("MQTT reconnected, republishing discovery and state")
+        self.discovery_dirty = True
+        self.last_state.clear()
+        self.last_avail.clear()
+        if self.running and self._nodes:
+            self._republish_task = self.loop.create_task(self._republish(), name="republish")
+
+    async def _republish(self):
+        """Publish the current shadow without fetching from Matter."""
+        try:
+            await self.refresh_snapshot(fetch=False)
+        except Exception as e:
+            logger.error(f"Republish after MQTT reconnect failed: {e}", exc_info=True)
+
+    def _apply_snapshot(self, nodes: List[Dict[str, Any]]):
+        """Replace the node shadow with a full snapshot from Matter."""
+        self._nodes = {int(n.get("node_id")): n for n in nodes}
+
+    def _on_matter_event(self, event: str, data: Any):
+        """Apply a pushed Matter event to the node shadow and publish changes."""
+        if event == "attribute_updated":
+            # data: [node_id, "<endpoint>/<cluster>/<attribute>", value]
+            node_id, path, value = data
+            node = self._nodes.get(int(node_id))
+            if node is None:
+                return
+            node.setdefault("attributes", {})[path] = value
+            if path.split("/")[1:2] != [str(ONOFF_CLUSTER_ID)]:
+                return
+        elif event in ("node_added", "node_updated"):
+            node = data
+            self._nodes[int(node["node_id"])] = node
+        elif event == "node_removed":
+            self._nodes.pop(int(data), None)
+            return
+        else:
+            logger.debug(f"Ignoring Matter event: {event}")
             return
 
-        for ep in endpoints:
-            self.publish_ha_discovery(ep)
+        self._publish_endpoints(extract_onoff_endpoints_from_node(node))
+
+    def _publish_endpoints(self, endpoints: List[EndpointInfo]) -> List[mqtt.MQTTMessageInfo]:
+        """Publish discovery, availability and state that changed for endpoints."""
+        # Collect everything first and publish in one pass, acks can be awaited by the caller
+        messages: List[Tuple[str, Union[str, bytes]]] = []
+
+        if self.discovery_dirty:
+            self._discovered.clear()
+            self.discovery_dirty = False
 
-        # Publish availability + state
         for ep in endpoints:
             key = (ep.node_id, ep.endpoint)
+            state_topic, avail_topic, disco_topic, disco_payload = self._render_endpoint(ep)
+
+            # discovery is retained by the broker, publish it once per endpoint
+            if key not in self._discovered:
+                self._discovered.add(key)
+                messages.append((disco_topic, disco_payload))
 
             # availability
             if self.last_avail.get(key) != ep.available:
                 self.last_avail[key] = ep.available
-                avail_value = "true" if ep.available else "false"
-                self.mqtt.publish_retained(topic_available(ep.node_id, ep.endpoint), avail_value)
+                avail_value = _AVAIL_PAYLOADS[ep.available]
+                messages.append((avail_topic, avail_value))
                 logger.info(
-                    f"Published availability for node {ep.node_id} endpoint {ep.endpoint}: {avail_value}"
+                    "Published availability for node %s endpoint %s: %s", ep.node_id, ep.endpoint, avail_value.decode()
                 )
 
             # state
             if ep.onoff is not None and self.last_state.get(key) != ep.onoff:
                 self.last_state[key] = ep.onoff
-                state_value = "ON" if ep.onoff else "OFF"
-                self.mqtt.publish_retained(topic_state(ep.node_id, ep.endpoint), state_value)
+                state_value = _STATE_PAYLOADS[ep.onoff]
+                messages.append((state_topic, state_value))
                 logger.info(
-                    f"Published state for node {ep.node_id} endpoint {ep.endpoint}: {state_value}"
+                    "Published state for node %s endpoint %s: %s", ep.node_id, ep.endpoint, state_value.decode()
                 )
 
-        # Log discovered endpoints
-        discovered = ", ".join([f"{e.node_id}/{e.endpoint}" for e in endpoints])
-        logger.info(f"Discovered OnOff endpoints: {discovered}")
+        return self.mqtt.publish_many(messages)
 
-    async def command_consumer_task(self):
-        """Consume commands from MQTT queue and send to Matter."""
-        while self.running:
-            cmd = await self.cmd_queue.get()
-            logger.info(f"Processing MQTT command: node {cmd.node_id} endpoint {cmd.endpoint} action {cmd.action}")
+    async def refresh_snapshot(self, fetch: bool = True):
+        """Publish state for all shadowed nodes, re-fetching them from Matter first unless fetch is False."""
+        if fetch:
+            # the reader hands the result to _apply_snapshot
+            await self.matter_ws.snapshot_nodes()
 
-            # Optimistically publish desired state immediately (optional)
-            if cmd.action in ("on", "off"):
-                desired = True if cmd.action == "on" else False
-                state_value = "ON" if desired else "OFF"
-                self.mqtt.publish_retained(topic_state(cmd.node_id, cmd.endpoint), state_value)
+        # Extract onoff endpoints for all nodes
+        endpoints: List[EndpointInfo] = []
+        for n in list(self._nodes.values()):
+            endpoints.extend(extract_onoff_endpoints_from_node(n))
 
-            # Send to Matter
-            try:
-                if self.matter_cmd.client is None:
-                    raise RuntimeError("Matter commander not connected. Commands unavailable.")
+        if not endpoints:
+            logger.debug("No OnOff endpoints found")
+            return
 
-                await self.matter_cmd.set_onoff(cmd.node_id, cmd.endpoint, cmd.action, timeout=15.0)
-                logger.info(f"Command sent successfully to node {cmd.node_id} endpoint {cmd.endpoint}")
-                # Refresh snapshot to confirm real state
-                await asyncio.sleep(1)
-                await self.refresh_snapshot()
+        infos = self._publish_endpoints(endpoints)
+        if not await self.mqtt.wait_all(infos):
+            logger.warning("Not all MQTT messages were acknowledged during refresh")
 
-            except Exception as e:
-                logger.error(
-                    f"Failed to send command to node {cmd.node_id} endpoint {cmd.endpoint}: {e}",
-                    exc_info=True,
+        # Log discovered endpoints only when the set changes
+        current = frozenset((e.node_id, e.endpoint) for e in endpoints)
+        if current != self._last_discovered_set and logger.isEnabledFor(logging.INFO):
+            logger.info(
+                "Discovered OnOff endpoints: %s",
+                ", ".join(f"{node_id}/{endpoint}" for node_id, endpoint in sorted(current)),
+            )
+        self._last_discovered_set = current
+
+    async def command_consumer_task(self):
+        """Consume commands from MQTT queue and send to Matter."""
+        while self.running:
+            # Coalesce everything already queued so bursts collapse to one command per endpoint
+            pending: Dict[Tuple[int, int], str] = {}
+            _coalesce_command(pending, await self.cmd_queue.get())
+            while True:
+                try:
+                    _coalesce_command(pending, self.cmd_queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+
+            for (node_id, endpoint), action in pending.items():
+                logger.info(f"Processing MQTT command: node {node_id} endpoint {endpoint} action {action}")
+
+                # Optimistically publish desired state immediately (optional)
+                if action in ("on", "off"):
+                    self.mqtt.publish_retained(topic_state(node_id, endpoint), _STATE_PAYLOADS[action == "on"])
+
+            # Send to Matter; endpoints are independent, so send them concurrently
+            if self.matter_cmd.client is None:
+                logger.error("Matter commander not connected. Commands unavailable.")
+            else:
+                results = await asyncio.gather(
+                    *(
+                        self.matter_cmd.set_onoff(node_id, endpoint, action, timeout=DEVICE_COMMAND_TIMEOUT)
+                        for (node_id, endpoint), action in pending.items()
+                    ),
+                    return_exceptions=True,
                 )
+                for (node_id, endpoint), result in zip(pending, results):
+                    if isinstance(result, BaseException):
+                        logger.error(
+                            f"Failed to send command to node {node_id} endpoint {endpoint}: {result}",
+                            exc_info=result,
+                        )
+                    else:
+                        logger.info(f"Command sent successfully to node {node_id} endpoint {endpoint}")
+
+            # Read back the real state of the affected endpoints only
+            await asyncio.gather(*(self.confirm_onoff(node_id, endpoint) for node_id, endpoint in pending))
+
+    async def confirm_onoff(self, node_id: int, endpoint: int):
+        """Read the OnOff attribute from Matter and publish it, replacing any optimistic state."""
+        try:
+            value = await self.matter_ws.read_onoff(node_id, endpoint)
+        except Exception as e:
+            logger.error(f"Failed to read state of node {node_id} endpoint {endpoint}: {e}", exc_info=True)
+            return
+        if value is None:
+            return
+
+        key = (node_id, endpoint)
+        self.last_state[key] = value
+        node = self._nodes.get(node_id)
+        if node is not None:
+            node.setdefault("attributes", {})[f"{endpoint}/{ONOFF_CLUSTER_ID}/{ONOFF_ATTRIBUTE_ID}"] = value
+        state_value = _STATE_PAYLOADS[value]
+        self.mqtt.publish_retained(topic_state(node_id, endpoint), state_value)
+        logger.info(f"Published state for node {node_id} endpoint {endpoint}: {state_value.decode()}")
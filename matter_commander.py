@@ -2,7 +2,6 @@
 
 import asyncio
 import logging
-from typing import Any, Dict, Optional
 
 import aiohttp
 
@@ -23,9 +22,10 @@ except ImportError as e:
 class MatterCommander:
     """Send commands to Matter devices."""
 
-    def __init__(self, ws_url: str):
+    def __init__(self, ws_url: str, session: aiohttp.ClientSession):
         self.ws_url = ws_url
-        self.session: Optional[aiohttp.ClientSession] = None
+        # Shared with MatterWS, owned and closed by the application
+        self.session = session
         self.client = None
         self._lock = asyncio.Lock()
 
@@ -33,8 +33,6 @@ class MatterCommander:
         """Connect to Matter server."""
         if MatterClient is None or Clusters is None:
             raise RuntimeError("MatterClient/Clusters not installed. Install matter-server package.")
-        if self.session is None or self.session.closed:
-            self.session = aiohttp.ClientSession()
         self.client = MatterClient(self.ws_url, self.session)
         try:
             await self.client.connect()
@@ -45,16 +43,13 @@ class MatterCommander:
 
     async def ensure_connected(self):
         """Ensure client is connected."""
+        # Fast path: no lock needed when a client already exists
+        if self.client is not None:
+            return
         async with self._lock:
-            if self.client is None:
-                await self.connect()
+            if self.client is not None:
                 return
-            # Some versions expose .connected, others don't; try a cheap call
-            try:
-                # If your version has server_info, this is a quick sanity check
-                _ = getattr(self.client, "server_info", None)
-            except Exception:
-                pass
+            await self.connect()
 
     async def close(self):
         """Close Matter connection."""
@@ -63,9 +58,6 @@ class MatterCommander:
                 await self.client.disconnect()
         finally:
             self.client = None
-            if self.session and not self.session.closed:
-                await self.session.close()
-            self.session = None
 
     async def set_onoff(self, node_id: int, endpoint: int, action: str, timeout: float = DEVICE_COMMAND_TIMEOUT):
         """Send OnOff command to device."""
@@ -85,33 +77,40 @@ class MatterCommander:
         async def _try(coro):
             return await asyncio.wait_for(coro, timeout=timeout)
 
+        # Remember which client this command used, concurrent commands may reconnect meanwhile
+        client = self.client
         try:
             # common signature
             logger.debug(f"Sending {action} command to node {node_id} endpoint {endpoint}")
-            return await _try(self.client.send_device_command(node_id, endpoint, cmd_obj))
+            return await _try(client.send_device_command(node_id, endpoint, cmd_obj))
         except Exception as e:
             # If disconnected, reconnect once and retry
             if "Not connected" in str(e) or "InvalidState" in type(e).__name__:
                 logger.info(f"Reconnecting to Matter client after disconnection")
-                await self._reconnect_and_retry(node_id, endpoint, cmd_obj, timeout)
+                await self._reconnect_and_retry(client, node_id, endpoint, cmd_obj, timeout)
                 return
             logger.error(f"Failed to send command to node {node_id}: {e}")
             raise
 
-    async def _reconnect_and_retry(self, node_id: int, endpoint: int, cmd_obj, timeout: float):
-        """Reconnect and retry command."""
+    async def _reconnect_and_retry(self, failed_client, node_id: int, endpoint: int, cmd_obj, timeout: float):
+        """Reconnect (unless another command already did) and retry command."""
         async with self._lock:
-            try:
-                if self.client:
-                    await self.client.disconnect()
-            except Exception as e:
-                logger.debug(f"Error disconnecting during reconnect: {e}")
-            self.client = None
-            await self.connect()
+            # Only the first command that saw failed_client replaces it, others reuse the new client
+            if self.client is failed_client:
+                try:
+                    if failed_client:
+                        await failed_client.disconnect()
+                except Exception as e:
+                    logger.debug(f"Error disconnecting during reconnect: {e}")
+                self.client = None
+                await self.connect()
+            client = self.client
+        if client is None:
+            raise RuntimeError("Matter client not connected")
 
         async def _try(coro):
             return await asyncio.wait_for(coro, timeout=timeout)
 
         # retry after reconnect
         logger.info(f"Retrying command to node {node_id} endpoint {endpoint}")
-        return await _try(self.client.send_device_command(node_id, endpoint, cmd_obj))
+        return await _try(client.send_device_command(node_id, endpoint, cmd_obj))
@@ -1,22 +1,14 @@
 """Helper functions for parsing Matter attributes."""
 
-from typing import Any, Dict, List, Optional, Set, Tuple
+from typing import Any, Dict, List, Optional
 
 from constants import ONOFF_CLUSTER_ID, ONOFF_ATTRIBUTE_ID
 from models import EndpointInfo
 
 
-def _parse_attr_key(key: str) -> Optional[Tuple[int, int, int]]:
-    """
-    Matter-server attribute dict keys look like: "1/6/0" meaning:
-      endpoint/cluster/attribute
-    Returns (endpoint, cluster, attribute) as ints.
-    """
-    try:
-        ep_s, cl_s, at_s = key.split("/", 2)
-        return int(ep_s), int(cl_s), int(at_s)
-    except Exception:
-        return None
+# Attribute keys look like "<endpoint>/<cluster>/<attribute>", e.g. "1/6/0"
+_ONOFF_CLUSTER_STR = str(ONOFF_CLUSTER_ID)
+_ONOFF_KEY_MARKER = f"/{_ONOFF_CLUSTER_STR}/"
 
 
 def extract_onoff_endpoints_from_node(node: Dict[str, Any]) -> List[EndpointInfo]:
@@ -28,34 +20,31 @@ def extract_onoff_endpoints_from_node(node: Dict[str, Any]) -> List[EndpointInfo
     available = bool(node.get("available", False))
     attrs: Dict[str, Any] = node.get("attributes", {}) or {}
 
-    # endpoints that have cluster 6 in any attribute
-    endpoints_with_onoff: Set[int] = set()
+    # endpoints that have cluster 6 in any attribute, in order of first appearance,
+    # mapped to the OnOff state stored at "<ep>/6/0" (None until seen)
+    eps: Dict[int, Optional[bool]] = {}
 
-    # OnOff state stored at "<ep>/6/0"
-    onoff_state_by_ep: Dict[int, bool] = {}
+    onoff_attribute_id = ONOFF_ATTRIBUTE_ID
+    marker = _ONOFF_KEY_MARKER
+    cluster_str = _ONOFF_CLUSTER_STR
 
     for k, v in attrs.items():
-        parsed = _parse_attr_key(k)
-        if not parsed:
+        # Most keys belong to other clusters, reject them before parsing
+        if marker not in k:
             continue
-        ep, cl, at = parsed
-        if cl == ONOFF_CLUSTER_ID:
-            endpoints_with_onoff.add(ep)
-            if at == ONOFF_ATTRIBUTE_ID:
-                # spec: OnOff attribute is boolean
-                try:
-                    onoff_state_by_ep[ep] = bool(v)
-                except (ValueError, TypeError):
-                    pass
-
-    infos: List[EndpointInfo] = []
-    for ep in sorted(endpoints_with_onoff):
-        infos.append(
-            EndpointInfo(
-                node_id=node_id,
-                endpoint=ep,
-                available=available,
-                onoff=onoff_state_by_ep.get(ep),
-            )
-        )
-    return infos
+        try:
+            i = k.index("/")
+            j = k.index("/", i + 1)
+            if k[i + 1:j] != cluster_str:
+                continue
+            ep = int(k[:i])
+            at = int(k[j + 1:])
+        except ValueError:
+            continue
+        if at == onoff_attribute_id:
+            # spec: OnOff attribute is boolean
+            eps[ep] = bool(v)
+        else:
+            eps.setdefault(ep, None)
+
+    return [EndpointInfo(node_id, ep, available, onoff) for ep, onoff in eps.items()]
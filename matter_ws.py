@@ -3,27 +3,62 @@
 import asyncio
 import json
 import logging
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional
 
 import aiohttp
 
-from constants import MATTER_WS_CONNECT_TIMEOUT, MATTER_SEND_COMMAND_TIMEOUT
+from constants import (
+    DEFAULT_MATTER_WS_COMPRESS,
+    MATTER_WS_CONNECT_TIMEOUT,
+    MATTER_SEND_COMMAND_TIMEOUT,
+    ONOFF_ATTRIBUTE_ID,
+    ONOFF_CLUSTER_ID,
+)
 
 logger = logging.getLogger(__name__)
 
+# Optional: orjson is considerably faster than the stdlib for large node snapshots.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_json_loads = orjson.loads if orjson is not None else json.loads
+
+
+def _json_dumps(obj: Any) -> str:
+    """Serialize obj to a JSON string."""
+    if orjson is not None:
+        return orjson.dumps(obj).decode("utf-8")
+    return json.dumps(obj)
+
 
 class MatterWS:
     """
     Raw WS client for:
       - HELLO
-      - start_listening (snapshot)
+      - start_listening (initial snapshot, then pushed events)
+      - get_nodes (full snapshot without subscribing)
+      - read_attribute (single OnOff read)
     """
 
-    def __init__(self, url: str):
+    def __init__(self, url: str, session: aiohttp.ClientSession, compress: int = DEFAULT_MATTER_WS_COMPRESS):
         self.url = url
+        self.compress = compress
         self.ws: Optional[aiohttp.ClientWebSocketResponse] = None
-        self.session: Optional[aiohttp.ClientSession] = None
+        # Shared with MatterCommander, owned and closed by the application
+        self.session = session
         self._msg_id = 0
+        # Responses are matched to requests by message_id
+        self._pending: Dict[str, asyncio.Future] = {}
+        # Optional per-request callbacks run by the reader before any later frame
+        self._on_response: Dict[str, Callable[[Dict[str, Any]], None]] = {}
+        self._reader_task: Optional[asyncio.Task] = None
+        self._closing = False
+        # Called as on_event(event, data) for every pushed event frame
+        self.on_event: Optional[Callable[[str, Any], None]] = None
+        # Called as on_nodes(nodes) with every full snapshot, before events that follow it
+        self.on_nodes: Optional[Callable[[List[Dict[str, Any]]], None]] = None
 
     def _next_id(self) -> str:
         self._msg_id += 1
@@ -32,10 +67,11 @@ class MatterWS:
     async def connect(self) -> Dict[str, Any]:
         """Connect to Matter WebSocket server."""
         try:
-            self.session = aiohttp.ClientSession()
-            self.ws = await self.session.ws_connect(self.url)
+            # Snapshots are large JSON; permessage-deflate is negotiated if the server supports it
+            self.ws = await self.session.ws_connect(self.url, compress=self.compress)
             logger.info(f"Connecting to Matter WebSocket at {self.url}")
             hello = await self._recv_json(timeout=MATTER_WS_CONNECT_TIMEOUT)
+            self._reader_task = asyncio.create_task(self._reader(), name="matter_ws_reader")
             logger.info("Matter WebSocket connection established")
             return hello
         except Exception as e:
@@ -44,10 +80,16 @@ class MatterWS:
 
     async def close(self):
         """Close WebSocket connection."""
+        self._closing = True
+        if self._reader_task:
+            self._reader_task.cancel()
+            try:
+                await self._reader_task
+            except asyncio.CancelledError:
+                pass
+            self._reader_task = None
         if self.ws:
             await self.ws.close()
-        if self.session:
-            await self.session.close()
 
     async def _recv_json(self, timeout: float) -> Dict[str, Any]:
         """Receive and parse JSON message."""
@@ -55,23 +97,84 @@ class MatterWS:
             raise RuntimeError("WebSocket not connected")
         msg = await self.ws.receive(timeout=timeout)
         if msg.type == aiohttp.WSMsgType.TEXT:
-            return json.loads(msg.data)
+            return _json_loads(msg.data)
         raise RuntimeError(f"Unexpected WebSocket message type: {msg.type}")
 
-    async def send_command(self, command: str, args: Dict[str, Any], timeout: float = MATTER_SEND_COMMAND_TIMEOUT) -> Dict[str, Any]:
+    async def _reader(self):
+        """Dispatch incoming frames to pending requests or the event callback."""
+        try:
+            async for msg in self.ws:
+                if msg.type != aiohttp.WSMsgType.TEXT:
+                    logger.debug(f"Ignoring WebSocket message type: {msg.type}")
+                    continue
+                try:
+                    frame = _json_loads(msg.data)
+                except ValueError as e:
+                    logger.warning(f"Invalid JSON from Matter WebSocket: {e}")
+                    continue
+
+                if "event" in frame:
+                    if self.on_event is not None:
+                        try:
+                            self.on_event(frame["event"], frame.get("data"))
+                        except Exception as e:
+                            logger.error(f"Error handling Matter event {frame['event']}: {e}", exc_info=True)
+                    continue
+
+                message_id = str(frame.get("message_id"))
+                on_response = self._on_response.pop(message_id, None)
+                if on_response is not None:
+                    try:
+                        on_response(frame)
+                    except Exception as e:
+                        logger.error(f"Error handling Matter response {message_id}: {e}", exc_info=True)
+
+                fut = self._pending.pop(message_id, None)
+                if fut is not None and not fut.done():
+                    fut.set_result(frame)
+                else:
+                    logger.debug(f"Unmatched Matter response: {frame.get('message_id')}")
+        finally:
+            for fut in self._pending.values():
+                if not fut.done():
+                    fut.set_exception(ConnectionError("Matter WebSocket closed"))
+            self._pending.clear()
+            self._on_response.clear()
+            if self._closing:
+                logger.debug("Matter WebSocket reader stopped")
+            else:
+                logger.warning("Matter WebSocket closed, no further Matter events will be received")
+
+    async def send_command(
+        self,
+        command: str,
+        args: Dict[str, Any],
+        timeout: float = MATTER_SEND_COMMAND_TIMEOUT,
+        on_response: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ) -> Dict[str, Any]:
         """
-        Sends a {"message_id","command","args"} frame and waits one response.
+        Sends a {"message_id","command","args"} frame and waits for the matching response.
+        on_response, if given, is called with the response by the reader before it
+        dispatches any later frame.
         """
-        if self.ws is None:
+        if self.ws is None or self._reader_task is None or self._reader_task.done():
             raise RuntimeError("WebSocket not connected")
-        frame = {"message_id": self._next_id(), "command": command, "args": args}
-        logger.debug(f"Sending Matter command: {command}")
-        await self.ws.send_str(json.dumps(frame))
-        return await self._recv_json(timeout=timeout)
+        message_id = self._next_id()
+        frame = {"message_id": message_id, "command": command, "args": args}
+        fut = asyncio.get_running_loop().create_future()
+        self._pending[message_id] = fut
+        if on_response is not None:
+            self._on_response[message_id] = on_response
+        try:
+            logger.debug(f"Sending Matter command: {command}")
+            await self.ws.send_str(_json_dumps(frame))
+            return await asyncio.wait_for(fut, timeout=timeout)
+        finally:
+            self._pending.pop(message_id, None)
+            self._on_response.pop(message_id, None)
 
-    async def snapshot_nodes(self) -> List[Dict[str, Any]]:
-        """Get snapshot of all nodes."""
-        resp = await self.send_command("start_listening", {}, timeout=MATTER_SEND_COMMAND_TIMEOUT)
+    def _nodes_from_response(self, resp: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Extract the node list from a start_listening/get_nodes response."""
         # resp: { "message_id": "...", "result": [ ...nodes... ] }
         nodes = resp.get("result", [])
         if not isinstance(nodes, list):
@@ -79,3 +182,38 @@ class MatterWS:
             return []
         logger.debug(f"Retrieved {len(nodes)} nodes from Matter")
         return nodes
+
+    def _deliver_nodes(self, resp: Dict[str, Any]):
+        """Hand a snapshot to on_nodes in frame order, so no event can slip in before it."""
+        if self.on_nodes is not None:
+            self.on_nodes(self._nodes_from_response(resp))
+
+    async def start_listening(self) -> List[Dict[str, Any]]:
+        """Subscribe to node events. Returns the initial snapshot of all nodes."""
+        resp = await self.send_command(
+            "start_listening", {}, timeout=MATTER_SEND_COMMAND_TIMEOUT, on_response=self._deliver_nodes
+        )
+        return self._nodes_from_response(resp)
+
+    async def snapshot_nodes(self) -> List[Dict[str, Any]]:
+        """Get snapshot of all nodes."""
+        resp = await self.send_command(
+            "get_nodes", {}, timeout=MATTER_SEND_COMMAND_TIMEOUT, on_response=self._deliver_nodes
+        )
+        return self._nodes_from_response(resp)
+
+    async def read_onoff(self, node_id: int, endpoint: int) -> Optional[bool]:
+        """Read the OnOff attribute of one endpoint. Returns None if not reported."""
+        path = f"{endpoint}/{ONOFF_CLUSTER_ID}/{ONOFF_ATTRIBUTE_ID}"
+        resp = await self.send_command(
+            "read_attribute",
+            {"node_id": node_id, "attribute_path": path},
+            timeout=MATTER_SEND_COMMAND_TIMEOUT,
+        )
+        if "error_code" in resp:
+            raise RuntimeError(f"read_attribute {path} on node {node_id} failed: {resp.get('details')}")
+        result = resp.get("result")
+        # Newer servers return {"<path>": value}, older ones the bare value
+        if isinstance(result, dict):
+            result = result.get(path)
+        return None if result is None else bool(result)
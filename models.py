@@ -4,18 +4,23 @@ from dataclasses import dataclass
 from typing import Optional
 
 
-@dataclass
+# __slots__ is declared by hand because dataclass(slots=True) needs Python 3.10
+@dataclass(frozen=True)
 class EndpointInfo:
     """Information about a Matter endpoint with OnOff cluster."""
+    __slots__ = ("node_id", "endpoint", "available", "onoff")
+
     node_id: int
     endpoint: int
     available: bool
     onoff: Optional[bool]  # None if unknown
 
 
-@dataclass
+@dataclass(frozen=True)
 class MqttCommand:
     """Command received from MQTT."""
+    __slots__ = ("node_id", "endpoint", "action")
+
     node_id: int
     endpoint: int
     action: str  # "on" | "off" | "toggle"
@@ -2,26 +2,57 @@
 
 import asyncio
 import logging
-from typing import Optional
+import re
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
 
 import paho.mqtt.client as mqtt
 
 from constants import (
     MQTT_CMD_TOPIC_PATTERN,
     MQTT_KEEPALIVE,
+    MQTT_PUBLISH_TIMEOUT,
     MQTT_QOS,
+    MQTT_RECONNECT_MAX_DELAY,
 )
 from models import MqttCommand
 
 logger = logging.getLogger(__name__)
 
+# Command topics look like matter/<node>/<ep>/set
+_CMD_TOPIC_RE = re.compile(r"matter/(\d+)/(\d+)/set")
+
+# Accepted command payloads (stripped, upper-cased) and the action they map to
+_PAYLOAD_ACTIONS = {
+    b"ON": "on",
+    b"1": "on",
+    b"TRUE": "on",
+    b"OFF": "off",
+    b"0": "off",
+    b"FALSE": "off",
+    b"TOGGLE": "toggle",
+    b"T": "toggle",
+}
+
 # These will be set after config is loaded in matter2mqtt_app
 MQTT_HOST = "localhost"
 MQTT_PORT = 1883
 
 
+def _log_published(topic: str, payload: Union[str, bytes]):
+    """Debug-log a published message, showing bytes payloads as text."""
+    if logger.isEnabledFor(logging.DEBUG):
+        if isinstance(payload, bytes):
+            payload = payload.decode("utf-8", errors="replace")
+        logger.debug(f"Published to {topic}: {payload}")
+
+
 class MqttBridge:
-    """Bridge between MQTT and asyncio event loop."""
+    """
+    Bridge between MQTT and asyncio event loop.
+
+    The paho socket is driven by the event loop (add_reader/add_writer) instead of
+    paho's background thread, so all callbacks run on the loop thread.
+    """
 
     def __init__(self, loop: asyncio.AbstractEventLoop, cmd_queue: asyncio.Queue[MqttCommand]):
         self.loop = loop
@@ -29,13 +60,26 @@ class MqttBridge:
         self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
 
         self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
         self.client.on_message = self._on_message
+        self.client.on_publish = self._on_publish
+        self.client.on_socket_open = self._on_socket_open
+        self.client.on_socket_close = self._on_socket_close
+        self.client.on_socket_register_write = self._on_socket_register_write
+        self.client.on_socket_unregister_write = self._on_socket_unregister_write
+
+        self._misc_task: Optional[asyncio.Task] = None
+        self._reconnect_task: Optional[asyncio.Task] = None
+        self._publish_waiters: Dict[int, asyncio.Future] = {}
+        self._closing = False
+        self._connected_once = False
+        # Called after every successful reconnect (not the first connect)
+        self.on_reconnect: Optional[Callable[[], None]] = None
 
     def connect(self):
         """Connect to MQTT broker."""
         try:
             self.client.connect(MQTT_HOST, MQTT_PORT, keepalive=MQTT_KEEPALIVE)
-            self.client.loop_start()
             logger.info(f"Connected to MQTT broker at {MQTT_HOST}:{MQTT_PORT}")
         except Exception as e:
             logger.error(f"Failed to connect to MQTT broker: {e}")
@@ -43,16 +87,124 @@ class MqttBridge:
 
     def close(self):
         """Close MQTT connection."""
+        self._closing = True
         try:
-            self.client.loop_stop()
+            if self._reconnect_task:
+                self._reconnect_task.cancel()
         finally:
             self.client.disconnect()
 
-    def publish_retained(self, topic: str, payload: str):
+    def publish_retained(self, topic: str, payload: Union[str, bytes]):
         """Publish a retained message."""
         # retained makes Domoticz / others see last state after restart
         self.client.publish(topic, payload=payload, qos=MQTT_QOS, retain=True)
-        logger.debug(f"Published to {topic}: {payload}")
+        _log_published(topic, payload)
+
+    def publish_many(self, items: Iterable[Tuple[str, Union[str, bytes]]]) -> List[mqtt.MQTTMessageInfo]:
+        """Publish retained messages without waiting for each acknowledgement."""
+        infos = []
+        for topic, payload in items:
+            infos.append(self.client.publish(topic, payload=payload, qos=MQTT_QOS, retain=True))
+            _log_published(topic, payload)
+        return infos
+
+    async def wait_all(self, infos: Iterable[mqtt.MQTTMessageInfo], timeout: float = MQTT_PUBLISH_TIMEOUT) -> bool:
+        """Wait until all messages are acknowledged. Returns False on timeout or error."""
+        ok = True
+        mids = []
+        for info in infos:
+            if info.rc != mqtt.MQTT_ERR_SUCCESS:
+                logger.warning(f"MQTT publish failed (mid {info.mid}): {mqtt.error_string(info.rc)}")
+                ok = False
+            elif not info.is_published():
+                self._publish_waiters.setdefault(info.mid, self.loop.create_future())
+                mids.append(info.mid)
+        if not mids:
+            return ok
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(self._publish_waiters[mid] for mid in mids)),
+                timeout=timeout,
+            )
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            for mid in mids:
+                self._publish_waiters.pop(mid, None)
+        return ok
+
+    def _on_publish(self, client, userdata, mid, reason_code, properties):
+        """Resolve the waiter for an acknowledged message."""
+        fut = self._publish_waiters.pop(mid, None)
+        if fut is not None and not fut.done():
+            fut.set_result(None)
+
+    def _on_loop(self, callback, *args):
+        """Run callback on the event loop thread; paho calls socket hooks from reconnect's executor thread too."""
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            callback(*args)
+        else:
+            self.loop.call_soon_threadsafe(callback, *args)
+
+    def _on_socket_open(self, client, userdata, sock):
+        """Start driving the paho socket from the event loop."""
+        self._on_loop(self._watch_socket, client, sock)
+
+    def _watch_socket(self, client, sock):
+        """Register the socket with the loop and start the misc task."""
+        self.loop.add_reader(sock, client.loop_read)
+        self._misc_task = self.loop.create_task(self._misc_loop(), name="mqtt_misc")
+
+    def _on_socket_close(self, client, userdata, sock):
+        """Stop driving the paho socket."""
+        self._on_loop(self._unwatch_socket, sock)
+
+    def _unwatch_socket(self, sock):
+        """Unregister the socket and stop the misc task."""
+        self.loop.remove_reader(sock)
+        self.loop.remove_writer(sock)
+        if self._misc_task:
+            self._misc_task.cancel()
+            self._misc_task = None
+
+    def _on_socket_register_write(self, client, userdata, sock):
+        """Flush pending writes when the socket becomes writable."""
+        self._on_loop(self.loop.add_writer, sock, client.loop_write)
+
+    def _on_socket_unregister_write(self, client, userdata, sock):
+        """Stop watching the socket for writability."""
+        self._on_loop(self.loop.remove_writer, sock)
+
+    async def _misc_loop(self):
+        """Run paho's keepalive/retry handling once per second."""
+        while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            await asyncio.sleep(1)
+
+    async def _reconnect(self):
+        """Reconnect to the broker with exponential backoff."""
+        delay = 1.0
+        while not self._closing:
+            await asyncio.sleep(delay)
+            try:
+                # DNS lookup and TCP connect block, keep them off the event loop
+                await self.loop.run_in_executor(None, self.client.reconnect)
+                logger.info(f"Reconnected to MQTT broker at {MQTT_HOST}:{MQTT_PORT}")
+                return
+            except Exception as e:
+                logger.warning(f"MQTT reconnect failed: {e}")
+                delay = min(delay * 2, MQTT_RECONNECT_MAX_DELAY)
+
+    def _on_disconnect(self, client, userdata, disconnect_flags, reason_code, properties):
+        """Handle MQTT disconnection."""
+        if self._closing:
+            return
+        logger.warning(f"Disconnected from MQTT broker: {reason_code}")
+        if self._reconnect_task is None or self._reconnect_task.done():
+            self._reconnect_task = self.loop.create_task(self._reconnect(), name="mqtt_reconnect")
 
     def _on_connect(self, client, userdata, flags, reason_code, properties):
         """Handle MQTT connection."""
@@ -63,34 +215,44 @@ class MqttBridge:
         client.subscribe(MQTT_CMD_TOPIC_PATTERN, qos=MQTT_QOS)
         logger.info(f"Subscribed to: {MQTT_CMD_TOPIC_PATTERN}")
 
+        if reason_code == 0:
+            # The broker may have lost retained messages while we were away
+            if self._connected_once and self.on_reconnect is not None:
+                self.on_reconnect()
+            self._connected_once = True
+
+    def _enqueue(self, cmd: MqttCommand):
+        """Queue a command. When the queue is full the oldest command is dropped, so the latest intent wins."""
+        if self.cmd_queue.full():
+            dropped = self.cmd_queue.get_nowait()
+            logger.warning(
+                f"Command queue full, dropping oldest command for node {dropped.node_id} "
+                f"endpoint {dropped.endpoint} action {dropped.action}"
+            )
+        self.cmd_queue.put_nowait(cmd)
+
     def _on_message(self, client, userdata, msg):
         """Handle incoming MQTT message."""
         try:
             topic = msg.topic  # matter/<node>/<ep>/set
-            payload = (msg.payload or b"").decode("utf-8", errors="replace").strip().upper()
-
-            parts = topic.split("/")
-            if len(parts) != 4 or parts[0] != "matter" or parts[3] != "set":
+            m = _CMD_TOPIC_RE.fullmatch(topic)
+            if m is None:
                 logger.debug(f"Ignoring malformed topic: {topic}")
                 return
 
-            node_id = int(parts[1])
-            endpoint = int(parts[2])
-
-            if payload in ("ON", "1", "TRUE"):
-                action = "on"
-            elif payload in ("OFF", "0", "FALSE"):
-                action = "off"
-            elif payload in ("TOGGLE", "T"):
-                action = "toggle"
-            else:
-                logger.warning(f"Unknown payload '{payload}' on {topic}")
+            payload = (msg.payload or b"").strip().upper()
+            action = _PAYLOAD_ACTIONS.get(payload)
+            if action is None:
+                logger.warning(f"Unknown payload '{payload.decode('utf-8', errors='replace')}' on {topic}")
                 return
 
+            node_id = int(m[1])
+            endpoint = int(m[2])
+
             logger.info(f"Received command from MQTT: node {node_id} endpoint {endpoint} action {action}")
             cmd = MqttCommand(node_id=node_id, endpoint=endpoint, action=action)
-            # push into asyncio loop safely from MQTT thread
-            self.loop.call_soon_threadsafe(self.cmd_queue.put_nowait, cmd)
+            # callbacks run on the event loop thread, no hand-off needed
+            self._enqueue(cmd)
 
         except Exception as e:
             logger.error(f"Error handling MQTT message: {e}", exc_info=True)